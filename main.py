@@ -1,21 +1,89 @@
-from typing import Annotated
+from typing import Annotated, BinaryIO, Iterator
 from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import asyncio
+import datetime
+import dask_geopandas
 import geopandas
-import json
 import os
+import functools
+import itertools
+import math
+import multiprocessing
+import numpy as np
+import orjson
 import pandas as pd
+import pyproj
+import shapely
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
-from supabase import create_client, Client
-import io
-import zipfile
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+import hashlib
+import httpx
+import jwt
 import tempfile
 import shutil
+import zipfile
 
 load_dotenv()
 
-app = FastAPI()
+url: str = os.environ.get("SUPABASE_URL")
+key: str = os.environ.get("SUPABASE_SERVICE_KEY")
+# Secret JWT legacy (HS256); opsional jika proyek sudah memakai signing key asimetris yang ada di JWKS
+jwt_secret: str | None = os.environ.get("SUPABASE_JWT_SECRET")
+
+# Ukuran grid koordinat pada respons GeoJSON (EPSG:4326)
+OUTPUT_GRID_SIZE = 1e-6
+
+# Ukuran potongan body saat GeoJSON dikirim secara streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Operasi yang dikirim ke pool proses bila total vertex kedua input melebihi ambang ini
+PROCESS_POOL_OPERATIONS = ["clip", "difference", "union", "intersect", "dissolve"]
+PROCESS_POOL_THRESHOLD = 200_000
+
+# Di atas jumlah fitur ini, operasi per baris pada file A dijalankan paralel per partisi dengan dask-geopandas
+LARGE_INPUT_THRESHOLD = 50_000
+PARTITIONED_OPERATIONS = ["clip", "difference", "intersect"]
+# Operasi terpartisi selalu berjalan di proses server dan semua request berbagi pool thread ini,
+# sehingga total thread dask tidak melebihi jumlah core meskipun beberapa request besar berjalan bersamaan
+DASK_WORKERS = os.cpu_count() or 1
+DASK_POOL = ThreadPoolExecutor(max_workers=DASK_WORKERS)
+
+async def fetch_jwks(client: httpx.AsyncClient) -> dict[str, jwt.PyJWK]:
+    try:
+        response = await client.get("/auth/v1/.well-known/jwks.json")
+        response.raise_for_status()
+        jwk_set = jwt.PyJWKSet.from_dict(response.json())
+    except Exception as e:
+        print(f"Could not load Supabase JWKS, falling back to network token verification: {e}")
+        return {}
+    return {jwk.key_id: jwk for jwk in jwk_set.keys}
+
+def create_process_pool() -> ProcessPoolExecutor:
+    # Pool proses untuk operasi geometri yang berat di CPU, sehingga beberapa request dapat memakai beberapa core.
+    # Memakai "spawn" karena fork dari proses yang sudah menjalankan thread (asyncio.to_thread) tidak aman.
+    return ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Satu koneksi HTTP/2 ber-pool ke Supabase untuk seluruh request di worker ini
+    app.state.http_client = httpx.AsyncClient(base_url=url, headers={"apikey": key}, http2=True)
+    # Ambil public key Supabase sekali saat startup agar JWT bisa diverifikasi tanpa request ke Supabase
+    app.state.jwks = await fetch_jwks(app.state.http_client)
+    app.state.process_pool = create_process_pool()
+    try:
+        yield
+    finally:
+        app.state.process_pool.shutdown(cancel_futures=True)
+        await app.state.http_client.aclose()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,46 +93,148 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(url, key)
+# GeoJSON sangat mudah dikompres; level 5 sudah memberi rasio yang baik dengan biaya CPU jauh di bawah level 9
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 token_auth_scheme = HTTPBearer()
 
-async def get_current_user(token: Annotated[HTTPAuthorizationCredentials, Depends(token_auth_scheme)]):
+# Cache hasil verifikasi token selama 60 detik, dengan kunci hash dari JWT
+user_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+def decode_token_locally(token: str) -> dict | None:
+    # Verifikasi tanda tangan dan masa berlaku JWT secara lokal; None jika tidak bisa diverifikasi di sini
     try:
-        user_response = supabase.auth.get_user(token.credentials)
-        user = user_response.user
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256":
+            if not jwt_secret:
+                return None
+            signing_key, algorithm = jwt_secret, "HS256"
+        else:
+            jwk = app.state.jwks.get(header.get("kid"))
+            if jwk is None:
+                return None
+            signing_key, algorithm = jwk.key, jwk.algorithm_name
+        claims = jwt.decode(
+            token, signing_key, algorithms=[algorithm], audience="authenticated", options={"require": ["exp", "sub"]}
+        )
+    except jwt.InvalidTokenError:
+        return None
+    return {**claims, "id": claims["sub"]}
+
+async def get_current_user(token: Annotated[HTTPAuthorizationCredentials, Depends(token_auth_scheme)]):
+    user = decode_token_locally(token.credentials)
+    if user is not None:
+        return user
+
+    # Verifikasi lokal gagal: cek ke Supabase lewat jaringan
+    cache_key = hashlib.sha256(token.credentials.encode()).hexdigest()
+    user = user_cache.get(cache_key)
+    if user is not None:
         return user
+
+    try:
+        response = await app.state.http_client.get(
+            "/auth/v1/user", headers={"Authorization": f"Bearer {token.credentials}"}
+        )
+        response.raise_for_status()
+        user = response.json()
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-def read_zip_shapefile_in_memory(file_content: bytes) -> geopandas.GeoDataFrame:    
-    temp_dir = tempfile.mkdtemp()
-    try:
-        bytes_io = io.BytesIO(file_content)
-        with zipfile.ZipFile(bytes_io, 'r') as zf:
-            zf.extractall(temp_dir)
-
-        shp_path = None
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                if file.endswith('.shp'):
-                    shp_path = os.path.join(root, file)
-                    break
-            if shp_path:
-                break
-        
-        if not shp_path:
-            raise HTTPException(status_code=400, detail="No .shp file found in the zip archive.")
-
-        gdf = geopandas.read_file(shp_path)
-        return gdf
+    if not user or not user.get("id"):
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    user_cache[cache_key] = user
+    return user
 
-    finally:
-        shutil.rmtree(temp_dir)
+@functools.lru_cache(maxsize=128)
+def _get_transformer(src: str, dst: str) -> pyproj.Transformer:
+    # Membangun pipeline PROJ itu mahal, jadi simpan satu Transformer per pasangan CRS
+    return pyproj.Transformer.from_crs(src, dst, always_xy=True)
+
+@functools.lru_cache(maxsize=128)
+def _get_crs(user_input: str) -> pyproj.CRS:
+    return pyproj.CRS.from_user_input(user_input)
+
+def reproject(data, target):
+    """Pengganti `to_crs` yang memakai Transformer dari cache."""
+    if data.crs is None:
+        raise ValueError("Cannot transform naive geometries. Please set a crs on the object first.")
+    target_crs = _get_crs(target) if isinstance(target, str) else pyproj.CRS.from_user_input(target)
+    # Lewati proyeksi ulang jika data sudah berada di CRS tujuan
+    if data.crs is target_crs or data.crs == target_crs:
+        return data
+    transformer = _get_transformer(data.crs.srs, target_crs.srs)
+
+    # include_z=None mempertahankan dimensi masing-masing geometri, sehingga input campuran 2D/3D tetap aman
+    geoms = shapely.transform(
+        np.asarray(data.geometry.values),
+        lambda coords: np.column_stack(transformer.transform(*coords.T)),
+        include_z=None,
+    )
+    geoms = geopandas.array.from_shapely(geoms, crs=target_crs)
+
+    if isinstance(data, geopandas.GeoDataFrame):
+        return data.set_geometry(geoms)
+    return geopandas.GeoSeries(geoms, index=data.index, name=data.name)
+
+def read_zip_shapefile(upload: BinaryIO, temp_dir: str, name: str, columns: list[str] | None = None) -> geopandas.GeoDataFrame:
+    # Salin upload secara bertahap ke satu file zip di direktori sementara milik request (tanpa menampung
+    # seluruh isinya di RAM), lalu baca langsung dari dalam arsip lewat /vsizip/ GDAL tanpa ekstraksi
+    zip_path = os.path.join(temp_dir, f"{name}.zip")
+    with open(zip_path, "wb") as temp_zip:
+        shutil.copyfileobj(upload, temp_zip)
+
+    # Cari .shp dari central directory zip, tanpa perlu menelusuri isi arsip
+    with zipfile.ZipFile(zip_path) as zf:
+        shp_name = next((member for member in zf.namelist() if member.lower().endswith(".shp")), None)
+    if not shp_name:
+        raise HTTPException(status_code=400, detail="No .shp file found in the zip archive.")
+
+    # columns=[] membuat pyogrio hanya membaca geometri dan melewati decoding DBF
+    gdf = geopandas.read_file(f"/vsizip/{zip_path}/{shp_name}", engine="pyogrio", columns=columns)
+    return gdf
+
+async def load_zip_shapefile(upload: UploadFile, crs: str, temp_dir: str, name: str, columns: list[str] | None = None) -> geopandas.GeoDataFrame:
+    # Baca dan proyeksikan shapefile di thread terpisah agar beberapa file dapat diproses bersamaan
+    def load():
+        return reproject(read_zip_shapefile(upload.file, temp_dir, name, columns), crs)
+
+    return await asyncio.to_thread(load)
+
+def _json_default(value):
+    # Nilai yang tidak dikenal orjson (mis. pd.Timestamp dari kolom tanggal DBF)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+def stream_features(gdf: geopandas.GeoDataFrame) -> Iterator[bytes]:
+    # Kirim FeatureCollection dalam potongan ~64 KB: yang ada di RAM hanya satu potongan, tanpa satu
+    # hop threadpool dan satu ASGI send untuk setiap fitur
+    chunk = bytearray(b'{"type":"FeatureCollection","features":[')
+    for i, feature in enumerate(gdf.iterfeatures(na="null", show_bbox=False, drop_id=False)):
+        if i:
+            chunk += b","
+        chunk += orjson.dumps(feature, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk = bytearray()
+    chunk += b"]}"
+    yield bytes(chunk)
+
+def to_geojson(gdf: geopandas.GeoDataFrame) -> Response:
+    # Bulatkan koordinat ke grid 1e-6 derajat (~11 cm) agar angka yang dikirim ke Leaflet jauh lebih pendek
+    geoms = shapely.set_precision(np.asarray(gdf.geometry.values), OUTPUT_GRID_SIZE, mode="pointwise")
+    gdf = gdf.set_geometry(geopandas.array.from_shapely(geoms, crs=gdf.crs))
+
+    # Potongan pertama diserialisasi di sini agar error serialisasi masih menjadi respons 500 dari handler,
+    # bukan body yang terpotong setelah header 200 terkirim
+    chunks = stream_features(gdf)
+    first_chunk = next(chunks)
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        # Koleksi kecil dikirim sebagai satu body biasa, sehingga minimum_size GZipMiddleware tetap berlaku
+        return Response(content=first_chunk, media_type="application/geo+json")
+    return StreamingResponse(itertools.chain([first_chunk, second_chunk], chunks), media_type="application/geo+json")
 
 
 @app.get("/")
@@ -72,25 +242,32 @@ def health_check():
     """Endpoint untuk health check dari Render."""
     return {"status": "ok", "message": "API is running"}
 
-# Endpoint Stage 2 (Diperbarui untuk Stage 7)
-@app.post("/buffer")
-async def buffer(
-    current_user: Annotated[dict, Depends(get_current_user)],
-    geojson_polygon: UploadFile = File(...),
-    buffer_value: int = Form(...)
-):
-    try:
-        print(f"Request received from authenticated user: {current_user.id}")
-        
-        # Baca GeoJSON. Asumsikan inputnya dalam EPSG:4326 (standar web)
-        gdf = geopandas.read_file(geojson_polygon.file)
-        if gdf.crs is None:
-            # Jika CRS tidak ada, asumsikan EPSG:4326
-            gdf.set_crs("EPSG:4326", inplace=True)
-        else:
-            # Jika ada, pastikan itu EPSG:4326
-            gdf = gdf.to_crs("EPSG:4326")
+def buffer_local_scale(geometry: geopandas.GeoSeries, distance: float, quad_segs: int) -> geopandas.GeoSeries:
+    # Aproksimasi ekuirektangular: skala derajat ke meter pada lintang tengah data, buffer dalam meter,
+    # lalu skala balik ke derajat. Cukup akurat untuk area kecil yang tidak terlalu dekat ke kutub.
+    lat0 = math.radians((geometry.total_bounds[1] + geometry.total_bounds[3]) / 2)
+    scale = np.array([111_320 * math.cos(lat0), 110_574])
 
+    geoms = shapely.transform(np.asarray(geometry.values), lambda coords: coords * scale)
+    geoms = shapely.simplify(geoms, tolerance=abs(distance) / 50)
+    geoms = shapely.buffer(geoms, distance, quad_segs=quad_segs)
+    geoms = shapely.transform(geoms, lambda coords: coords / scale)
+    return geopandas.GeoSeries(geoms, index=geometry.index, crs=geometry.crs)
+
+def _do_buffer(geojson_file: BinaryIO, buffer_value: int, fast_mode: bool = False, quad_segs: int = 4) -> Response:
+    # Baca GeoJSON. Asumsikan inputnya dalam EPSG:4326 (standar web)
+    gdf = geopandas.read_file(geojson_file)
+    if gdf.crs is None:
+        # Jika CRS tidak ada, asumsikan EPSG:4326
+        gdf.set_crs("EPSG:4326", inplace=True)
+    else:
+        # Jika ada, pastikan itu EPSG:4326
+        gdf = reproject(gdf, "EPSG:4326")
+
+    if fast_mode:
+        # Mode cepat: buffer langsung di EPSG:4326 dengan skala meter lokal, tanpa dua kali proyeksi PROJ
+        gdf_buffer_final = buffer_local_scale(gdf.geometry, buffer_value, quad_segs)
+    else:
         # --- Logika Inti Stage 7 ---
         # 1. Estimasi CRS UTM yang paling sesuai untuk poligon 
         # Melihat pusat dari geometri
@@ -98,24 +275,164 @@ async def buffer(
         print(f"Detected optimal UTM CRS: {utm_crs.to_string()}")
 
         # 2. Proyeksikan ke CRS UTM yang terdeteksi untuk operasi buffer yang akurat
-        gdf_projected = gdf.to_crs(utm_crs)
+        gdf_projected = reproject(gdf, utm_crs)
 
-        # 3. Lakukan buffer dalam satuan meter pada sistem proyeksi UTM
-        gdf_buffered_projected = gdf_projected.buffer(buffer_value)
+        # 3. Lakukan buffer dalam satuan meter pada sistem proyeksi UTM (langsung pada array geometri, satu loop GEOS).
+        # Input disederhanakan dulu dengan toleransi 1/50 jarak buffer agar GEOS memproses lebih sedikit vertex.
+        geoms = shapely.simplify(np.asarray(gdf_projected.geometry.values), tolerance=abs(buffer_value) / 50)
+        buffered = shapely.buffer(geoms, buffer_value, quad_segs=quad_segs)
+        gdf_buffered_projected = geopandas.GeoSeries(buffered, index=gdf_projected.index, crs=utm_crs)
 
         # 4. Proyeksikan kembali hasilnya ke EPSG:4326 agar bisa ditampilkan di peta Leaflet
-        gdf_buffer_final = gdf_buffered_projected.to_crs("EPSG:4326")
-        
-        # Ubah hasil GeoSeries menjadi GeoDataFrame sebelum diekspor ke JSON
-        result_gdf = geopandas.GeoDataFrame(geometry=gdf_buffer_final, crs="EPSG:4326")
+        gdf_buffer_final = reproject(gdf_buffered_projected, "EPSG:4326")
+    
+    # Ubah hasil GeoSeries menjadi GeoDataFrame sebelum diekspor ke JSON
+    result_gdf = geopandas.GeoDataFrame(geometry=gdf_buffer_final, crs="EPSG:4326")
+
+    return to_geojson(result_gdf)
 
-        return json.loads(result_gdf.to_json())
+# Endpoint Stage 2 (Diperbarui untuk Stage 7)
+@app.post("/buffer")
+async def buffer(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    geojson_polygon: UploadFile = File(...),
+    buffer_value: int = Form(...),
+    fast_mode: bool = Form(False),
+    # Jumlah segmen per seperempat lingkaran pada sudut buffer; 4 sudah cukup halus untuk tampilan peta
+    quad_segs: int = Form(4, ge=1)
+):
+    try:
+        print(f"Request received from authenticated user: {current_user['id']}")
+
+        # Jalankan pemrosesan geometri di thread terpisah agar event loop tidak terblokir
+        return await asyncio.to_thread(_do_buffer, geojson_polygon.file, buffer_value, fast_mode, quad_segs)
 
     except Exception as e:
         print(f"Error during buffer processing: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+def is_coverage(geoms: np.ndarray) -> bool:
+    # Coverage union hanya benar untuk poligon yang tidak saling tumpang tindih dan bertemu tepat di tepinya
+    geoms = np.asarray(geoms)
+    geoms = geoms[~shapely.is_missing(geoms)]
+    if not np.isin(shapely.get_type_id(geoms), [3, 6]).all():
+        return False
+    # coverage_is_valid tidak memeriksa validitas tiap poligon (mis. bowtie), padahal coverage union membutuhkannya
+    if not shapely.is_valid(geoms).all():
+        return False
+    # Subset dari coverage tetap coverage, jadi tolak lebih awal lewat sampel kecil sebelum memeriksa semuanya
+    if len(geoms) > 1000 and not shapely.coverage_is_valid(geoms[:1000]):
+        return False
+    return bool(shapely.coverage_is_valid(geoms))
+
+def union_all(geoms: np.ndarray) -> shapely.Geometry:
+    # Input yang membentuk coverage (mis. batas administrasi) bisa digabung jauh lebih cepat dengan coverage union
+    if is_coverage(geoms):
+        return shapely.coverage_union_all(geoms)
+    return shapely.union_all(geoms)
+
+def clip(gdf_a: geopandas.GeoDataFrame, mask: geopandas.GeoDataFrame | shapely.Geometry) -> geopandas.GeoDataFrame:
+    # Ambil kandidat lewat spatial index, lalu hanya hitung intersection untuk geometri yang melewati tepi mask;
+    # geometri yang sepenuhnya berada di dalam mask diambil apa adanya
+    if isinstance(mask, geopandas.GeoDataFrame):
+        mask = union_all(mask.geometry.values)
+    shapely.prepare(mask)
+
+    candidates = gdf_a.iloc[np.sort(gdf_a.sindex.query(mask, predicate="intersects"))]
+    geoms = np.asarray(candidates.geometry.values).copy()
+    edge = ~shapely.within(geoms, mask)
+    geoms[edge] = shapely.intersection(geoms[edge], mask)
+
+    result_gdf = candidates.set_geometry(geopandas.array.from_shapely(geoms, crs=gdf_a.crs))
+    return result_gdf[~result_gdf.is_empty]
+
+def difference(gdf_a: geopandas.GeoDataFrame, gdf_b: geopandas.GeoDataFrame) -> geopandas.GeoDataFrame:
+    # Cari pasangan yang beririsan lewat STRtree, lalu kurangi setiap geometri A hanya dengan
+    # union dari geometri B yang menyentuhnya, bukan dengan union seluruh gdf_b
+    a_geoms = np.asarray(gdf_a.geometry.values)
+    b_geoms = np.asarray(gdf_b.geometry.values)
+    tree = shapely.STRtree(b_geoms)
+    left, right = tree.query(a_geoms, predicate="intersects")
+
+    result = a_geoms.copy()
+    if left.size:
+        order = np.argsort(left, kind="stable")
+        left, right = left[order], right[order]
+        hits, starts = np.unique(left, return_index=True)
+        masks = [shapely.union_all(b_geoms[group]) for group in np.split(right, starts[1:])]
+        result[hits] = shapely.difference(a_geoms[hits], masks)
+
+    return geopandas.GeoDataFrame(geometry=result, index=gdf_a.index, crs=gdf_a.crs)
+
+def _apply_operation(operation: str, gdf_a: geopandas.GeoDataFrame, gdf_b: geopandas.GeoDataFrame | None) -> geopandas.GeoDataFrame:
+    if operation == "clip":
+        result_gdf = clip(gdf_a, gdf_b)
+    elif operation == "difference":
+        result_gdf = difference(gdf_a, gdf_b)
+    elif operation == "union":
+        # Satu union bertingkat atas gabungan kedua array, bukan tiga operasi union terpisah
+        geoms = np.concatenate([gdf_a.geometry.values, gdf_b.geometry.values])
+        result_gdf = union_all(geoms)
+        result_gdf = geopandas.GeoDataFrame(geometry=[result_gdf], crs="EPSG:3395")
+    elif operation == "intersect":
+        result_gdf = geopandas.overlay(gdf_a, gdf_b, how='intersection')
+    elif operation == "merge":
+        result_gdf = pd.concat([gdf_a, gdf_b], ignore_index=True, copy=False)
+    elif operation == "dissolve":
+        method = "coverage" if is_coverage(gdf_a.geometry.values) else "unary"
+        result_gdf = gdf_a.dissolve(method=method)
+    else:
+        raise ValueError(f"Operation '{operation}' not supported.")
+
+    return reproject(result_gdf, "EPSG:4326")
+
+def is_partitioned(operation: str, gdf_a: geopandas.GeoDataFrame) -> bool:
+    return operation in PARTITIONED_OPERATIONS and len(gdf_a) > LARGE_INPUT_THRESHOLD
+
+def _run_operation(operation: str, gdf_a: geopandas.GeoDataFrame, gdf_b: geopandas.GeoDataFrame | None) -> geopandas.GeoDataFrame:
+    # Bisa dijalankan di app.state.process_pool, sehingga input dan hasilnya harus bisa di-pickle
+    if not is_partitioned(operation, gdf_a):
+        return _apply_operation(operation, gdf_a, gdf_b)
+
+    # Operasi ini dihitung per baris gdf_a, jadi gdf_a bisa dipartisi dan setiap partisi
+    # diproses terhadap seluruh gdf_b secara paralel oleh scheduler thread dask
+    if operation == "clip":
+        # Union mask cukup dihitung sekali, bukan di setiap partisi. Mask ini sengaja tidak di-prepare:
+        # geometri prepared yang dipakai bersamaan oleh beberapa thread bisa membuat GEOS segfault
+        gdf_b = union_all(gdf_b.geometry.values)
+
+    dgf_a = dask_geopandas.from_geopandas(gdf_a, npartitions=DASK_WORKERS)
+    meta = _apply_operation_to_partition(gdf_a.iloc[:0], operation, gdf_b)
+    result_gdf = dgf_a.map_partitions(_apply_operation_to_partition, operation, gdf_b, meta=meta).compute(
+        scheduler="threads", pool=DASK_POOL
+    )
+    if operation == "intersect":
+        # overlay menomori ulang index di setiap partisi
+        result_gdf = result_gdf.reset_index(drop=True)
+    return result_gdf
+
+def _apply_operation_to_partition(partition: geopandas.GeoDataFrame, operation: str, gdf_b: geopandas.GeoDataFrame | shapely.Geometry) -> geopandas.GeoDataFrame:
+    if operation == "clip":
+        # Setiap partisi memakai salinan mask sendiri, karena clip() mem-prepare mask tersebut
+        gdf_b = shapely.from_wkb(shapely.to_wkb(gdf_b))
+    return _apply_operation(operation, partition, gdf_b)
+
+async def run_in_process_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        process_pool = app.state.process_pool
+        try:
+            return await loop.run_in_executor(process_pool, func, *args)
+        except BrokenProcessPool:
+            # Worker mati (segfault/OOM) membuat pool tidak bisa dipakai lagi; ganti dengan pool baru lalu coba
+            # sekali lagi. Hanya pool yang rusak ini yang diganti, karena request lain mungkin sudah menggantinya.
+            if app.state.process_pool is process_pool:
+                app.state.process_pool = create_process_pool()
+                process_pool.shutdown(wait=False, cancel_futures=True)
+            if attempt:
+                raise
+
 # Endpoint Stage 6 
 @app.post("/process")
 async def process_geospatial(
@@ -125,45 +442,47 @@ async def process_geospatial(
     file_b: UploadFile = File(None)
 ):
     try:
-        gdf_a = read_zip_shapefile_in_memory(await file_a.read())
-        gdf_a = gdf_a.to_crs("EPSG:3395")
-        
-        result_gdf = None
-
-        if operation in ["clip", "difference", "union", "intersect", "merge"]:
-            if not file_b:
-                raise HTTPException(status_code=400, detail=f"Operation '{operation}' requires two files.")
-            gdf_b = read_zip_shapefile_in_memory(await file_b.read())
-            gdf_b = gdf_b.to_crs("EPSG:3395")
-
-            if operation == "clip":
-                result_gdf = geopandas.clip(gdf_a, gdf_b)
-            elif operation == "difference":
-                b_unary = gdf_b.unary_union
-                result_gdf = gdf_a.difference(b_unary)
-                result_gdf = geopandas.GeoDataFrame(geometry=result_gdf, crs="EPSG:3395")
-            elif operation == "union":
-                a_unary = gdf_a.unary_union
-                b_unary = gdf_b.unary_union
-                result_gdf = a_unary.union(b_unary)
-                result_gdf = geopandas.GeoDataFrame(geometry=[result_gdf], crs="EPSG:3395")
-            elif operation == "intersect":
-                result_gdf = geopandas.overlay(gdf_a, gdf_b, how='intersection')
-            elif operation == "merge":
-                result_gdf = pd.concat([gdf_a, gdf_b], ignore_index=True)
-        
-        elif operation == "dissolve":
-            result_gdf = gdf_a.dissolve()
-        
+        # Satu direktori sementara untuk semua file pada request ini, dihapus sekali setelah selesai dibaca
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if operation in ["clip", "difference", "union", "intersect", "merge"]:
+                if not file_b:
+                    raise HTTPException(status_code=400, detail=f"Operation '{operation}' requires two files.")
+                # Atribut tidak ikut ke hasil untuk operasi ini, jadi cukup baca geometrinya saja
+                a_columns = [] if operation in ["difference", "union"] else None
+                b_columns = [] if operation in ["clip", "difference", "union"] else None
+
+                # Baca kedua file secara bersamaan di thread terpisah. Tunggu keduanya selesai walaupun salah satunya
+                # gagal, agar temp_dir tidak dihapus saat thread lain masih menulis ke dalamnya
+                gdf_a, gdf_b = await asyncio.gather(
+                    load_zip_shapefile(file_a, "EPSG:3395", temp_dir, "a", a_columns),
+                    load_zip_shapefile(file_b, "EPSG:3395", temp_dir, "b", b_columns),
+                    return_exceptions=True,
+                )
+                for loaded in (gdf_a, gdf_b):
+                    if isinstance(loaded, BaseException):
+                        raise loaded
+            elif operation == "dissolve":
+                gdf_a = await load_zip_shapefile(file_a, "EPSG:3395", temp_dir, "a")
+                gdf_b = None
+            else:
+                raise HTTPException(status_code=400, detail=f"Operation '{operation}' not supported.")
+
+        # Operasi overlay/union berat di CPU pada input besar dijalankan di pool proses agar request lain tetap
+        # dilayani; sisanya cukup di thread, karena biaya pickle ke worker lebih besar dari operasinya sendiri
+        num_coordinates = sum(
+            int(shapely.get_num_coordinates(np.asarray(gdf.geometry.values)).sum())
+            for gdf in (gdf_a, gdf_b) if gdf is not None
+        )
+        # Operasi terpartisi tidak dikirim ke pool proses agar tetap memakai DASK_POOL bersama
+        if not is_partitioned(operation, gdf_a) and operation in PROCESS_POOL_OPERATIONS and num_coordinates > PROCESS_POOL_THRESHOLD:
+            result_gdf = await run_in_process_pool(_run_operation, operation, gdf_a, gdf_b)
         else:
-            raise HTTPException(status_code=400, detail=f"Operation '{operation}' not supported.")
+            result_gdf = await asyncio.to_thread(_run_operation, operation, gdf_a, gdf_b)
 
-        if result_gdf is None or result_gdf.empty:
+        if result_gdf.empty:
             raise HTTPException(status_code=404, detail="The operation resulted in an empty geometry.")
 
-        result_gdf = result_gdf.to_crs("EPSG:4326")
-        
-        return json.loads(result_gdf.to_json())
+        return await asyncio.to_thread(to_geojson, result_gdf)
 
     except Exception as e:
         print(f"Error during processing: {e}")
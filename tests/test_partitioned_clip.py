@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import geopandas
+import shapely
+
+import main
+
+
+def test_clip_with_multiple_partitions_matches_single_partition(monkeypatch):
+    # Regresi: mask yang di-prepare dan dipakai bersama oleh beberapa thread dask membuat GEOS segfault
+    rng = np.random.default_rng(1)
+    gdf_a = geopandas.GeoDataFrame(
+        {"v": np.arange(20_000)},
+        geometry=shapely.buffer(shapely.points(rng.random((20_000, 2)) * 1e5), 300, quad_segs=2),
+        crs="EPSG:3395",
+    )
+    gdf_b = geopandas.GeoDataFrame(
+        geometry=shapely.buffer(shapely.points(rng.random((300, 2)) * 1e5), 4000),
+        crs="EPSG:3395",
+    )
+    expected = main._apply_operation("clip", gdf_a, gdf_b)
+
+    monkeypatch.setattr(main, "LARGE_INPUT_THRESHOLD", 0)
+    monkeypatch.setattr(main, "DASK_WORKERS", 4)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        monkeypatch.setattr(main, "DASK_POOL", pool)
+        for _ in range(3):
+            result = main._run_operation("clip", gdf_a, gdf_b)
+            assert result.index.equals(expected.index)
+            assert shapely.equals_exact(
+                np.asarray(result.geometry.values), np.asarray(expected.geometry.values), 1e-9
+            ).all()